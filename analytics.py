@@ -0,0 +1,162 @@
+# analytics.py
+# Incrementally maintained diagnostic counters, persisted next to reports.json.
+# classify_route records each report as it is written so dashboards never
+# rescan the report history; the file can always be rebuilt from reports.json.
+import os
+import json
+import fcntl
+import threading
+from contextlib import contextmanager
+from copy import deepcopy
+
+CONFIDENCE_BINS = 10  # 0-10%, 10-20%, ... 90-100%
+
+
+def _empty_bucket():
+    return {"total": 0, "disease": {}, "stage": {}, "disease_stage": {},
+            "confidence_hist": [0] * CONFIDENCE_BINS, "confidence_sum": 0.0, "daily": {}}
+
+def _empty_state():
+    return {"report_count": 0, "site": _empty_bucket(), "clinicians": {}}
+
+def _confidence_bin(conf):
+    try: conf = float(conf)
+    except (TypeError, ValueError): conf = 0.0
+    if conf <= 1: conf *= 100  # older reports stored fractions
+    return min(max(int(conf // (100 / CONFIDENCE_BINS)), 0), CONFIDENCE_BINS - 1), conf
+
+def _add(bucket, report):
+    disease = str(report.get("disease") or "Unknown")
+    stage = str(report.get("stage") if report.get("stage") is not None else "N/A")
+    day = str(report.get("date") or "")[:10] or "unknown"
+    idx, conf = _confidence_bin(report.get("confidence"))
+    bucket["total"] += 1
+    bucket["disease"][disease] = bucket["disease"].get(disease, 0) + 1
+    bucket["stage"][stage] = bucket["stage"].get(stage, 0) + 1
+    per_disease = bucket["disease_stage"].setdefault(disease, {})
+    per_disease[stage] = per_disease.get(stage, 0) + 1
+    bucket["confidence_hist"][idx] += 1
+    bucket["confidence_sum"] += conf
+    bucket["daily"][day] = bucket["daily"].get(day, 0) + 1
+
+
+class DiagnosticAnalytics:
+    def __init__(self, path, reports_file):
+        self.path = path
+        self.reports_file = reports_file
+        self._state = None
+        self._stamp = None
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _locked(self):
+        """Thread lock plus an flock on a sidecar file, held across read-modify-write.
+
+        The thread lock alone lets two gunicorn workers load the same state and
+        the later save drop the other's increment.
+        """
+        with self._lock, open(f"{self.path}.lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    # --- persistence ---
+    def _file_stamp(self):
+        try:
+            st = os.stat(self.path)
+            return (st.st_ino, st.st_mtime_ns, st.st_size)
+        except OSError:
+            return None
+
+    def _load_reports(self):
+        try:
+            with open(self.reports_file, "r") as f: return json.load(f)
+        except: return []
+
+    def _save(self):
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f: json.dump(self._state, f)
+        os.replace(tmp, self.path)
+        self._stamp = self._file_stamp()
+
+    def _ensure_loaded(self):
+        # Another worker may have written since we last looked; pick up its counts
+        stamp = self._file_stamp()
+        if self._state is not None and stamp == self._stamp: return
+        state = None
+        if stamp is not None:
+            try:
+                with open(self.path, "r") as f: state = json.load(f)
+            except: state = None
+        if state is None or "site" not in state:
+            self._rebuild_locked()
+        else:
+            self._state, self._stamp = state, stamp
+
+    def _rebuild_locked(self):
+        state = _empty_state()
+        reports = self._load_reports()
+        for r in reports:
+            _add(state["site"], r)
+            _add(state["clinicians"].setdefault(str(r.get("username")), _empty_bucket()), r)
+        state["report_count"] = len(reports)
+        self._state = state
+        self._save()
+
+    def rebuild(self):
+        """Recompute every counter from reports.json (one full scan)."""
+        with self._locked():
+            self._rebuild_locked()
+            return self._state["report_count"]
+
+    def verify(self):
+        """Rebuild if the stored report count disagrees with reports.json."""
+        with self._locked():
+            self._ensure_loaded()
+            if self._state["report_count"] != len(self._load_reports()):
+                self._rebuild_locked()
+
+    # --- updates ---
+    def record(self, report):
+        with self._locked():
+            self._ensure_loaded()
+            _add(self._state["site"], report)
+            _add(self._state["clinicians"].setdefault(str(report.get("username")), _empty_bucket()), report)
+            self._state["report_count"] += 1
+            self._save()
+
+    # --- queries ---
+    def summary(self, user_id=None, days=None):
+        """Dashboard view of the site (user_id=None) or one clinician's counters."""
+        # _ensure_loaded may rebuild and save when analytics.json is missing or
+        # unreadable, so reads take the same cross-process lock as record()
+        with self._locked():
+            self._ensure_loaded()
+            if user_id is None: bucket = self._state["site"]
+            else: bucket = self._state["clinicians"].get(str(user_id), _empty_bucket())
+            bucket = deepcopy(bucket)
+        daily = sorted(bucket.pop("daily").items())
+        if days is not None and days > 0: daily = daily[-days:]
+        step = 100 // CONFIDENCE_BINS
+        total = bucket["total"]
+        return {
+            "total": total,
+            "by_disease": bucket["disease"],
+            "by_stage": bucket["stage"],
+            "by_disease_stage": bucket["disease_stage"],
+            "confidence": {
+                "mean": round(bucket["confidence_sum"] / total, 2) if total else 0.0,
+                "histogram": [{"range": f"{i * step}-{(i + 1) * step}", "count": c}
+                              for i, c in enumerate(bucket["confidence_hist"])],
+            },
+            "daily": [{"date": d, "count": c} for d, c in daily],
+        }
+
+
+if __name__ == "__main__":
+    # python analytics.py  -> rebuild analytics.json from reports.json
+    base = os.path.abspath(os.path.dirname(__file__))
+    store = DiagnosticAnalytics(os.path.join(base, "analytics.json"), os.path.join(base, "reports.json"))
+    print(f"Rebuilt analytics from {store.rebuild()} reports")
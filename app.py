@@ -4,15 +4,26 @@
 import os
 import json
 import uuid
+import fcntl
+import tempfile
+import threading
 from datetime import datetime, timedelta
 from functools import wraps
+from contextlib import contextmanager
 import traceback 
 
 from flask import Flask, request, jsonify, send_from_directory
 from flask_cors import CORS 
 import jwt
-from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename 
+from werkzeug.exceptions import RequestEntityTooLarge
+
+from intake import IntakeRequest, save_upload, UploadRejected
+from auth import (
+    AuthBusy, LoginRateLimiter, TokenCache, UserIndex, hash_password, verify_password
+)
+from analytics import DiagnosticAnalytics
+from profiling import PROFILING_ENABLED, profiler
 
 # --- Import project modules ---
 try:
@@ -25,20 +36,27 @@ except ImportError:
 try:
     from classify import predict_disease
 except ImportError:
-    def predict_disease(path): return {"invalid": True, "detail": "Classifier not available."}
+    def predict_disease(path, **kwargs): return {"invalid": True, "detail": "Classifier not available."}
 
 try:
     from stage_predictor import predict_stage
 except ImportError:
-     def predict_stage(path): return {"stage": "N/A"}
+     def predict_stage(path, **kwargs): return {"stage": "N/A"}
 
 # --- Configuration ---
 JWT_SECRET = os.environ.get("JWT_SECRET", "supersecretdevkey")
 JWT_ALGORITHM = "HS256"
 JWT_EXP_HOURS = int(os.environ.get("JWT_EXP_HOURS", "24"))
+MAX_UPLOAD_MB = int(os.environ.get("MAX_UPLOAD_MB", "25"))
+MAX_UPLOAD_BYTES = MAX_UPLOAD_MB * 1024 * 1024
+# Test-time augmentation: batched flip/rotation views, one forward call per model
+CLASSIFY_TTA = os.environ.get("CLASSIFY_TTA", "0") == "1"
+STAGE_TTA = os.environ.get("STAGE_TTA", "0") == "1"
+TTA_VIEWS = int(os.environ.get("TTA_VIEWS", "8"))
 BASE_DIR = os.path.abspath(os.path.dirname(__file__))
 USERS_FILE = os.path.join(BASE_DIR, "users.json")
 REPORTS_FILE = os.path.join(BASE_DIR, "reports.json")
+ANALYTICS_FILE = os.path.join(BASE_DIR, "analytics.json")
 UPLOAD_FOLDER = os.path.join(BASE_DIR, "uploads")
 STATIC_FOLDER = os.path.join(BASE_DIR, "static")
 OUTPUTS_BASE_FOLDER = os.path.join(STATIC_FOLDER, "outputs") 
@@ -54,12 +72,37 @@ if not os.path.exists(USERS_FILE):
 if not os.path.exists(REPORTS_FILE):
     with open(REPORTS_FILE, "w") as f: json.dump([], f)
 
+IntakeRequest.max_upload_bytes = MAX_UPLOAD_BYTES
+
 app = Flask(__name__)
+app.request_class = IntakeRequest  # validates uploads while the body is parsed
 app.static_folder = STATIC_FOLDER 
+# Oversized bodies are refused from Content-Length before anything is parsed
+app.config["MAX_CONTENT_LENGTH"] = MAX_UPLOAD_BYTES + 64 * 1024  # headroom for multipart framing
 
 # --- CORS: ALLOW EVERYTHING ---
 CORS(app, resources={r"/*": {"origins": "*"}})
 
+# --- Auth state (per worker) ---
+user_index = UserIndex(USERS_FILE)
+token_cache = TokenCache()
+login_limiter = LoginRateLimiter()
+
+# --- Dashboard counters (rebuilt from reports.json if missing or stale) ---
+analytics = DiagnosticAnalytics(ANALYTICS_FILE, REPORTS_FILE)
+analytics.verify()
+
+# --- Worker memory profiler (opt-in via ENABLE_PROFILING=1) ---
+if PROFILING_ENABLED: profiler.start()
+
+@app.errorhandler(RequestEntityTooLarge)
+def upload_too_large(e):
+    return jsonify({"error": f"File too large (max {MAX_UPLOAD_MB} MB)"}), 413
+
+@app.errorhandler(UploadRejected)
+def upload_rejected(e):
+    return jsonify({"error": e.message}), e.status_code
+
 # --- SECURITY GUARD (The Fix) ---
 def token_required(f):
     @wraps(f)
@@ -77,7 +120,10 @@ def token_required(f):
             if parts[0].lower() != "bearer" or len(parts) != 2: 
                 raise ValueError("Invalid header")
             token = parts[1]
-            data = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+            data = token_cache.get(token)
+            if data is None:
+                data = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+                token_cache.put(token, data)
             request.user = data 
         except: 
             return jsonify({"error": "Invalid token"}), 401
@@ -91,9 +137,45 @@ def load_json(filepath):
         with open(filepath, "r") as f: return json.load(f)
     except: return []
 def save_json(filepath, data):
+    # Write to a unique temp file, then rename, so readers never see a half-written file
+    tmp = None
     try:
-        with open(filepath, "w") as f: json.dump(data, f, indent=2)
-    except: pass
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(filepath), prefix=os.path.basename(filepath), suffix=".tmp")
+        with os.fdopen(fd, "w") as f: json.dump(data, f, indent=2)
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, filepath)
+    except:
+        traceback.print_exc()
+        if tmp and os.path.exists(tmp): os.remove(tmp)
+_json_locks = {}
+@contextmanager
+def locked_json(filepath):
+    """Load a JSON store for read-modify-write; save it inside the block.
+
+    Holds a per-file thread lock plus an flock on a sidecar file (as
+    DiagnosticAnalytics does), so concurrent requests in any worker can't
+    interleave their load/append/save and drop each other's updates.
+    """
+    lock = _json_locks.setdefault(filepath, threading.Lock())
+    with lock, open(f"{filepath}.lock", "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield load_json(filepath)
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+def save_users(users):
+    save_json(USERS_FILE, users)
+    user_index.invalidate()
+def is_admin_user():
+    user = user_index.get_by_id(request.user.get("id"))
+    return bool(user and user.get("is_admin"))
+def days_arg():
+    # None when absent; raises ValueError unless it is a positive integer
+    raw = request.args.get("days")
+    if raw is None: return None
+    days = int(raw)
+    if days <= 0: raise ValueError("days must be positive")
+    return days
 def create_token(payload):
     payload["exp"] = datetime.utcnow() + timedelta(hours=JWT_EXP_HOURS)
     return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
@@ -122,15 +204,19 @@ def signup():
     password = data.get("password")
     name = data.get("name")
     
-    users = load_json(USERS_FILE)
-    if any(u["email"] == email for u in users): return jsonify({"error": "User exists"}), 400
+    if not password: return jsonify({"error": "Password required"}), 400
+    if user_index.get_by_email(email): return jsonify({"error": "User exists"}), 400
+    try: password_hash = hash_password(password)
+    except AuthBusy: return jsonify({"error": "Server busy, try again"}), 503
     
-    uid = uuid.uuid4().hex
-    users.append({
-        "id": uid, "name": name, "email": email,
-        "password_hash": generate_password_hash(password), "is_admin": False
-    })
-    save_json(USERS_FILE, users)
+    with locked_json(USERS_FILE) as users:
+        if any(u["email"] == email for u in users): return jsonify({"error": "User exists"}), 400
+        uid = uuid.uuid4().hex
+        users.append({
+            "id": uid, "name": name, "email": email,
+            "password_hash": password_hash, "is_admin": False
+        })
+        save_users(users)
     token = create_token({"id": uid, "email": email, "name": name})
     return jsonify({"token": token, "user": {"id": uid, "name": name, "email": email}}), 201
 
@@ -141,10 +227,13 @@ def login():
     data = request.get_json(silent=True) or {}
     email = data.get("email", "").lower()
     password = data.get("password")
-    users = load_json(USERS_FILE)
-    user = next((u for u in users if u["email"] == email), None)
+    if not login_limiter.allow(email): return jsonify({"error": "Too many login attempts"}), 429
+    user = user_index.get_by_email(email)
     
-    if user and check_password_hash(user.get("password_hash"), password):
+    try: ok = bool(user) and verify_password(user.get("password_hash"), password)
+    except AuthBusy: return jsonify({"error": "Server busy, try again"}), 503
+    if ok:
+        login_limiter.reset(email)
         token = create_token({"id": user["id"], "email": email, "name": user["name"]})
         return jsonify({"token": token, "user": {"id": user["id"], "name": user["name"]}}), 200
     return jsonify({"error": "Invalid credentials"}), 401
@@ -160,11 +249,14 @@ def classify_route():
     
     filename = f"{uuid.uuid4().hex}_{secure_filename(file.filename)}"
     save_path = os.path.join(UPLOAD_FOLDER, filename)
-    file.save(save_path)
+    try:
+        save_upload(file, save_path, MAX_UPLOAD_BYTES)
+    except UploadRejected as e:
+        return jsonify({"error": e.message}), e.status_code
     
     try:
         # Prediction
-        res = predict_disease(save_path)
+        res = predict_disease(save_path, tta=CLASSIFY_TTA, tta_views=TTA_VIEWS)
         if res.get("invalid"): return jsonify({"error": "Invalid Image"}), 400
         
         disease = res.get("class_name", "Unknown")
@@ -173,8 +265,11 @@ def classify_route():
         
         # Stage & PDF
         stage = "N/A"
+        stage_agreement = None
         if disease == "ALL":
-             stage = predict_stage(save_path).get("stage", "Unknown")
+             stage_res = predict_stage(save_path, tta=STAGE_TTA, tta_views=TTA_VIEWS)
+             stage = stage_res.get("stage", "Unknown")
+             stage_agreement = stage_res.get("agreement")
              
         report_id = uuid.uuid4().hex
         pdf_name = f"report_{report_id}.pdf"
@@ -197,15 +292,21 @@ def classify_route():
         report_entry = {
             "id": report_id, "username": request.user.get("id"), "disease": disease,
             "confidence": conf, "stage": stage, "date": datetime.now().isoformat(),
-            "gradcam": gradcam_rel, "pdf": final_pdf_rel
+            "gradcam": gradcam_rel, "pdf": final_pdf_rel,
+            "agreement": res.get("agreement"), "stage_agreement": stage_agreement
         }
-        reports = load_json(REPORTS_FILE)
-        reports.append(report_entry)
-        save_json(REPORTS_FILE, reports)
+        with locked_json(REPORTS_FILE) as reports:
+            reports.append(report_entry)
+            save_json(REPORTS_FILE, reports)
+        try: analytics.record(report_entry)
+        except: traceback.print_exc()
         
         return jsonify({
             "prediction": disease, "confidence": conf, "stage": stage,
             "explanation": res.get("explanation"),
+            "probabilities": res.get("probabilities"),
+            "agreement": res.get("agreement"),
+            "stage_agreement": stage_agreement,
             "gradcam_url": to_full_url(gradcam_rel),
             "pdf_url": to_full_url(final_pdf_rel)
         }), 200
@@ -233,6 +334,25 @@ def get_reports():
         })
     return jsonify(final), 200
 
+@app.route("/analytics", methods=["GET", "OPTIONS"])
+@app.route("/api/analytics", methods=["GET", "OPTIONS"])
+@token_required
+def analytics_route():
+    if request.method == "OPTIONS": return jsonify({"status": "ok"}), 200
+    try: days = days_arg()
+    except ValueError: return jsonify({"error": "days must be a positive integer"}), 400
+    return jsonify(analytics.summary(request.user.get("id"), days=days)), 200
+
+@app.route("/analytics/site", methods=["GET", "OPTIONS"])
+@app.route("/api/analytics/site", methods=["GET", "OPTIONS"])
+@token_required
+def site_analytics_route():
+    if request.method == "OPTIONS": return jsonify({"status": "ok"}), 200
+    if not is_admin_user(): return jsonify({"error": "Admin only"}), 403
+    try: days = days_arg()
+    except ValueError: return jsonify({"error": "days must be a positive integer"}), 400
+    return jsonify(analytics.summary(days=days)), 200
+
 @app.route("/profile", methods=["GET", "PUT", "OPTIONS"])
 @app.route("/api/profile", methods=["GET", "PUT", "OPTIONS"])
 @token_required
@@ -250,10 +370,63 @@ def profile_route():
     if request.method == "PUT":
         if idx == -1: return jsonify({"error": "User not found"}), 404
         data = request.get_json(silent=True) or {}
-        for k in ["name", "hospital", "specialization", "phone", "location", "about"]:
-            if k in data: users[idx][k] = data[k]
-        save_json(USERS_FILE, users)
+        # Re-read under the lock so a concurrent signup or edit is not overwritten
+        with locked_json(USERS_FILE) as users:
+            idx = next((i for i, u in enumerate(users) if u["id"] == user_id), -1)
+            if idx == -1: return jsonify({"error": "User not found"}), 404
+            for k in ["name", "hospital", "specialization", "phone", "location", "about"]:
+                if k in data: users[idx][k] = data[k]
+            save_users(users)
         return jsonify({"success": True}), 200
 
+# --- ADMIN: PER-WORKER MEMORY PROFILE ---
+def admin_profile_guard():
+    if not PROFILING_ENABLED: return jsonify({"error": "Profiling disabled"}), 404
+    if not is_admin_user(): return jsonify({"error": "Admin only"}), 403
+    return None
+
+@app.route("/admin/profile", methods=["GET", "OPTIONS"])
+@app.route("/api/admin/profile", methods=["GET", "OPTIONS"])
+@token_required
+def admin_profile_route():
+    if request.method == "OPTIONS": return jsonify({"status": "ok"}), 200
+    denied = admin_profile_guard()
+    if denied: return denied
+    return jsonify(profiler.report(top=request.args.get("top", 15, type=int))), 200
+
+@app.route("/admin/profile/rss", methods=["GET", "OPTIONS"])
+@app.route("/api/admin/profile/rss", methods=["GET", "OPTIONS"])
+@token_required
+def admin_profile_rss_route():
+    if request.method == "OPTIONS": return jsonify({"status": "ok"}), 200
+    denied = admin_profile_guard()
+    if denied: return denied
+    return jsonify({"pid": os.getpid(), "interval_s": profiler.interval, "samples": list(profiler.samples)}), 200
+
+@app.route("/admin/profile/snapshots", methods=["GET", "POST", "OPTIONS"])
+@app.route("/api/admin/profile/snapshots", methods=["GET", "POST", "OPTIONS"])
+@token_required
+def admin_profile_snapshots_route():
+    if request.method == "OPTIONS": return jsonify({"status": "ok"}), 200
+    denied = admin_profile_guard()
+    if denied: return denied
+    if request.method == "POST":
+        label = (request.get_json(silent=True) or {}).get("label", "")
+        return jsonify({"id": profiler.take_snapshot(label), "pid": os.getpid()}), 201
+    return jsonify({"pid": os.getpid(), "snapshots": profiler.snapshots()}), 200
+
+@app.route("/admin/profile/diff", methods=["GET", "OPTIONS"])
+@app.route("/api/admin/profile/diff", methods=["GET", "OPTIONS"])
+@token_required
+def admin_profile_diff_route():
+    if request.method == "OPTIONS": return jsonify({"status": "ok"}), 200
+    denied = admin_profile_guard()
+    if denied: return denied
+    try:
+        diff = profiler.diff(request.args.get("base", type=int), request.args.get("target", type=int),
+                             top=request.args.get("top", 25, type=int))
+    except KeyError: return jsonify({"error": "Unknown snapshot id"}), 404
+    return jsonify(diff), 200
+
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=int(os.environ.get("PORT", 5000)))
\ No newline at end of file
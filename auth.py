@@ -0,0 +1,165 @@
+# auth.py
+# Auth hot path helpers: scrypt hashing off the request thread, per-account
+# login rate limiting, an email -> user index and a cache of verified tokens.
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+HASH_WORKERS = int(os.environ.get("AUTH_HASH_WORKERS", "2"))
+HASH_QUEUE_LIMIT = int(os.environ.get("AUTH_HASH_QUEUE_LIMIT", "16"))
+HASH_TIMEOUT = float(os.environ.get("AUTH_HASH_TIMEOUT", "10"))
+LOGIN_MAX_ATTEMPTS = int(os.environ.get("LOGIN_MAX_ATTEMPTS", "10"))
+LOGIN_WINDOW_SECONDS = int(os.environ.get("LOGIN_WINDOW_SECONDS", "60"))
+TOKEN_CACHE_TTL = int(os.environ.get("TOKEN_CACHE_TTL", "300"))
+TOKEN_CACHE_SIZE = int(os.environ.get("TOKEN_CACHE_SIZE", "1024"))
+
+
+class AuthBusy(Exception):
+    """Raised when the hashing queue is full; callers should answer 503."""
+
+
+# --- Bounded password hashing ---
+# hashlib.scrypt releases the GIL, so a small pool keeps a login surge from
+# starving inference threads while the semaphore caps how much work can queue.
+# This only helps threaded workers (e.g. gunicorn --threads N); the default
+# sync worker still blocks on the future, and only gains the queue bound.
+_hash_executor = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix="pwhash")
+_hash_slots = threading.BoundedSemaphore(HASH_WORKERS + HASH_QUEUE_LIMIT)
+
+def _run_hash(fn, *args):
+    if not _hash_slots.acquire(blocking=False):
+        raise AuthBusy("Too many concurrent password checks")
+    try:
+        future = _hash_executor.submit(fn, *args)
+    except Exception:
+        _hash_slots.release()
+        raise
+    future.add_done_callback(lambda _: _hash_slots.release())
+    try:
+        return future.result(timeout=HASH_TIMEOUT)
+    except FutureTimeout:
+        raise AuthBusy("Password check timed out in the hashing queue")
+
+def verify_password(password_hash, password):
+    if not password_hash or password is None: return False
+    return _run_hash(check_password_hash, password_hash, password)
+
+def hash_password(password):
+    return _run_hash(generate_password_hash, password)
+
+
+# --- Per-account rate limiting ---
+class LoginRateLimiter:
+    def __init__(self, max_attempts=LOGIN_MAX_ATTEMPTS, window=LOGIN_WINDOW_SECONDS):
+        self.max_attempts = max_attempts
+        self.window = window
+        self._attempts = {}
+        self._lock = threading.Lock()
+
+    def allow(self, key):
+        """Record an attempt for key; False once the window's budget is spent."""
+        now = time.monotonic()
+        with self._lock:
+            q = self._attempts.setdefault(key, deque())
+            while q and now - q[0] > self.window: q.popleft()
+            if len(q) >= self.max_attempts: return False
+            q.append(now)
+            # Drop idle accounts so the table does not grow with every email ever tried
+            if len(self._attempts) > 10000:
+                self._attempts = {k: v for k, v in self._attempts.items() if v and now - v[-1] <= self.window}
+            return True
+
+    def reset(self, key):
+        with self._lock: self._attempts.pop(key, None)
+
+
+# --- Email -> user index ---
+class UserIndex:
+    """In-memory index over users.json, reloaded when the file changes on disk."""
+
+    def __init__(self, path):
+        self.path = path
+        self._stamp = None
+        self._by_email = {}
+        self._by_id = {}
+        self._lock = threading.Lock()
+
+    def _file_stamp(self):
+        try:
+            st = os.stat(self.path)
+            # save_json replaces the file atomically, so every write gets a new inode
+            return (st.st_ino, st.st_mtime_ns, st.st_size)
+        except OSError:
+            return None
+
+    def _refresh(self):
+        stamp = self._file_stamp()
+        if stamp is not None and stamp == self._stamp: return
+        with self._lock:
+            if stamp is not None and stamp == self._stamp: return
+            try:
+                with open(self.path, "r") as f: users = json.load(f)
+            except: users = []
+            self._by_email = {u.get("email"): u for u in users}
+            self._by_id = {u.get("id"): u for u in users}
+            self._stamp = stamp
+
+    def invalidate(self):
+        # Called after every write; other workers notice via the file stamp
+        with self._lock: self._stamp = None
+
+    def get_by_email(self, email):
+        self._refresh()
+        return self._by_email.get(email)
+
+    def get_by_id(self, user_id):
+        self._refresh()
+        return self._by_id.get(user_id)
+
+
+# --- Verified token cache ---
+class TokenCache:
+    """LRU of decoded JWT payloads keyed by token digest, bounded by TTL and exp."""
+
+    def __init__(self, ttl=TOKEN_CACHE_TTL, maxsize=TOKEN_CACHE_SIZE):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def digest(token):
+        return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+    def get(self, token):
+        if self.ttl <= 0: return None
+        key = self.digest(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None: return None
+            payload, expires_at = entry
+            if time.time() >= expires_at:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return dict(payload)
+
+    def put(self, token, payload):
+        if self.ttl <= 0: return
+        expires_at = time.time() + self.ttl
+        exp = payload.get("exp")
+        if isinstance(exp, (int, float)): expires_at = min(expires_at, exp)
+        key = self.digest(token)
+        with self._lock:
+            self._entries[key] = (dict(payload), expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize: self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock: self._entries.clear()
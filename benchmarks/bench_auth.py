@@ -0,0 +1,121 @@
+# benchmarks/bench_auth.py
+# Login and authenticated-request overhead: old inline path vs auth.py helpers.
+#
+#   python benchmarks/bench_auth.py [--users 5000] [--logins 20] [--requests 20000]
+import os
+import sys
+import json
+import time
+import uuid
+import argparse
+import tempfile
+import threading
+from datetime import datetime, timedelta
+
+import jwt
+from werkzeug.security import generate_password_hash, check_password_hash
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from auth import TokenCache, UserIndex, verify_password
+
+SECRET = "bench-secret-bench-secret-bench-secret"
+ALGORITHM = "HS256"
+PASSWORD = "correct horse battery staple"
+
+
+def _timeit(fn, n):
+    start = time.perf_counter()
+    for _ in range(n): fn()
+    return (time.perf_counter() - start) / n
+
+
+def make_users(path, count):
+    # One real scrypt hash reused for every account keeps setup fast
+    pw_hash = generate_password_hash(PASSWORD)
+    users = [{"id": uuid.uuid4().hex, "name": f"user{i}", "email": f"user{i}@example.com",
+              "password_hash": pw_hash, "is_admin": False} for i in range(count)]
+    with open(path, "w") as f: json.dump(users, f)
+    return users
+
+
+def bench_login(path, users, n):
+    target = users[-1]["email"]  # worst case for the linear scan
+
+    def old_login():
+        with open(path, "r") as f: all_users = json.load(f)
+        user = next((u for u in all_users if u["email"] == target), None)
+        assert check_password_hash(user["password_hash"], PASSWORD)
+
+    index = UserIndex(path)
+
+    def new_login():
+        user = index.get_by_email(target)
+        assert verify_password(user["password_hash"], PASSWORD)
+
+    def old_lookup():
+        with open(path, "r") as f: all_users = json.load(f)
+        next((u for u in all_users if u["email"] == target), None)
+
+    def new_lookup():
+        index.get_by_email(target)
+
+    new_lookup()  # build the index once, as the first login in a worker would
+    print(f"login (lookup + scrypt)     old {_timeit(old_login, n) * 1e3:8.2f} ms   new {_timeit(new_login, n) * 1e3:8.2f} ms")
+    print(f"user lookup only            old {_timeit(old_lookup, n * 10) * 1e3:8.3f} ms   new {_timeit(new_lookup, n * 10) * 1e3:8.3f} ms")
+
+
+def bench_surge(users, logins):
+    """Inference-loop throughput while a burst of concurrent logins is verified."""
+    pw_hash = users[0]["password_hash"]
+
+    def spin(stop, counter):
+        while not stop.is_set():
+            sum(range(1000)); counter[0] += 1
+
+    def run(check):
+        stop, counter = threading.Event(), [0]
+        worker = threading.Thread(target=spin, args=(stop, counter)); worker.start()
+        surge = [threading.Thread(target=check) for _ in range(logins)]
+        start, before = time.perf_counter(), counter[0]
+        for t in surge: t.start()
+        for t in surge: t.join()
+        elapsed, done = time.perf_counter() - start, counter[0] - before
+        stop.set(); worker.join()
+        return done / elapsed, elapsed
+
+    old_rate, old_t = run(lambda: check_password_hash(pw_hash, PASSWORD))
+    new_rate, new_t = run(lambda: verify_password(pw_hash, PASSWORD))
+    print(f"surge of {logins} logins       old {old_t:6.2f} s, inference {old_rate:9.0f} it/s   "
+          f"new {new_t:6.2f} s, inference {new_rate:9.0f} it/s")
+
+
+def bench_token(n):
+    token = jwt.encode({"id": "u1", "email": "a@b.c", "name": "A",
+                        "exp": datetime.utcnow() + timedelta(hours=1)}, SECRET, algorithm=ALGORITHM)
+    cache = TokenCache(ttl=300)
+
+    def old_verify():
+        jwt.decode(token, SECRET, algorithms=[ALGORITHM])
+
+    def new_verify():
+        data = cache.get(token)
+        if data is None:
+            data = jwt.decode(token, SECRET, algorithms=[ALGORITHM])
+            cache.put(token, data)
+
+    print(f"authenticated request       old {_timeit(old_verify, n) * 1e6:8.2f} us   new {_timeit(new_verify, n) * 1e6:8.2f} us")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--logins", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=20000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "users.json")
+        users = make_users(path, args.users)
+        bench_login(path, users, args.logins)
+        bench_surge(users, args.logins)
+    bench_token(args.requests)
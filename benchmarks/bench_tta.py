@@ -0,0 +1,61 @@
+# benchmarks/bench_tta.py
+# 8-view batched TTA vs 8 sequential predictions, using stand-in models.
+#
+#   python benchmarks/bench_tta.py [--repeats 10] [--views 8]
+import os
+import time
+import argparse
+import tempfile
+
+from standin_models import install, scratch_outputs, write_smear
+
+
+def _timeit(fn, n):
+    fn()  # warm-up (graph tracing, oneDNN kernel selection)
+    start = time.perf_counter()
+    for _ in range(n): fn()
+    return (time.perf_counter() - start) / n
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument("--views", type=int, default=8)
+    args = parser.parse_args()
+
+    classify, stage_predictor = install()
+    from tta import tta_predict, tta_views
+
+    with tempfile.TemporaryDirectory() as tmp, scratch_outputs():
+        path = write_smear(os.path.join(tmp, "smear.jpg"))
+        img_input = classify.preprocess_image(path)
+        views = [v[None] for v in tta_views(img_input, args.views)]
+
+        def model_sequential():
+            for v in views: classify.model.predict(v, verbose=0)
+
+        def model_batched():
+            tta_predict(classify.model, img_input, args.views)
+
+        def stage_sequential():
+            for _ in range(args.views): stage_predictor.predict_stage(path)
+
+        def stage_batched():
+            stage_predictor.predict_stage(path, tta=True, tta_views=args.views)
+
+        def disease_sequential():
+            for _ in range(args.views): classify.predict_disease(path)
+
+        def disease_batched():
+            classify.predict_disease(path, tta=True, tta_views=args.views)
+
+        rows = [
+            ("classifier forward", model_sequential, model_batched),
+            ("predict_stage", stage_sequential, stage_batched),
+            ("predict_disease (end to end)", disease_sequential, disease_batched),
+        ]
+        results = [(name, _timeit(seq, args.repeats), _timeit(bat, args.repeats)) for name, seq, bat in rows]
+
+    print(f"\n{'':30s} {args.views} sequential     {args.views}-view TTA    speedup")
+    for name, seq, bat in results:
+        print(f"{name:30s} {seq * 1e3:10.1f} ms   {bat * 1e3:10.1f} ms   {seq / bat:6.1f}x")
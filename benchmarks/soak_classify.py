@@ -0,0 +1,103 @@
+# benchmarks/soak_classify.py
+# Soak test: drive classify_route thousands of times with stand-in models and
+# fail (exit 1) if worker RSS grows by more than --max-growth-mb after warm-up.
+#
+#   python benchmarks/soak_classify.py [--iterations 2000] [--max-growth-mb 64]
+import os
+import io
+import gc
+import sys
+import time
+import argparse
+import tempfile
+
+import cv2
+
+from standin_models import ROOT, install, scratch_outputs, write_smear
+
+RUNTIME_FILES = ["reports.json", "analytics.json", "analytics.json.lock"]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--warmup", type=int, default=50)
+    parser.add_argument("--sample-every", type=int, default=100)
+    parser.add_argument("--max-growth-mb", type=float, default=64.0)
+    parser.add_argument("--no-stage", action="store_true", help="let the classifier pick freely instead of forcing ALL")
+    parser.add_argument("--no-tracemalloc", action="store_true")
+    args = parser.parse_args()
+
+    classify, stage_predictor = install()
+    if not args.no_stage:
+        # Bias the stand-in classifier towards "ALL" so every request also runs predict_stage
+        dense = classify.model.layers[-1]
+        dense.bias.assign([8.0] + [0.0] * (dense.units - 1))
+
+    # Importing app creates its JSON stores in the repo root; remove any it adds
+    existing = {f for f in RUNTIME_FILES if os.path.exists(os.path.join(ROOT, f))}
+    import app as app_module
+    from analytics import DiagnosticAnalytics
+    from profiling import WorkerProfiler, rss_bytes, tf_stats
+
+    tmp = tempfile.TemporaryDirectory()
+    try:
+        with scratch_outputs():
+            # Keep every file the route writes inside the temp dir
+            app_module.REPORTS_FILE = os.path.join(tmp.name, "reports.json")
+            app_module.UPLOAD_FOLDER = os.path.join(tmp.name, "uploads")
+            app_module.REPORTS_OUTPUT_FOLDER = os.path.join(tmp.name, "reports")
+            for d in (app_module.UPLOAD_FOLDER, app_module.REPORTS_OUTPUT_FOLDER): os.makedirs(d)
+            app_module.save_json(app_module.REPORTS_FILE, [])
+            app_module.analytics = DiagnosticAnalytics(os.path.join(tmp.name, "analytics.json"), app_module.REPORTS_FILE)
+
+            ok, img_bytes = cv2.imencode(".jpg", cv2.imread(write_smear(os.path.join(tmp.name, "smear.jpg"))))
+            img_bytes = img_bytes.tobytes()
+            client = app_module.app.test_client()
+            token = app_module.create_token({"id": "soak", "email": "soak@example.com", "name": "Soak"})
+            headers = {"Authorization": f"Bearer {token}"}
+
+            profiler = None if args.no_tracemalloc else WorkerProfiler(interval=0).start()
+            failures = 0
+
+            def request_once():
+                resp = client.post("/api/classify", headers=headers, content_type="multipart/form-data",
+                                   data={"file": (io.BytesIO(img_bytes), "smear.jpg")})
+                return resp.status_code == 200
+
+            for _ in range(args.warmup): failures += not request_once()
+            gc.collect()
+            baseline = rss_bytes() / 2**20
+            base_snap = profiler.take_snapshot("after warm-up") if profiler else None
+            print(f"baseline after {args.warmup} warm-up requests: {baseline:.1f} MB, {tf_stats(max_age=0)}")
+
+            start = time.perf_counter()
+            for i in range(1, args.iterations + 1):
+                failures += not request_once()
+                if i % args.sample_every == 0 or i == args.iterations:
+                    gc.collect()
+                    rss = rss_bytes() / 2**20
+                    stats = tf_stats(max_age=0)
+                    print(f"[{i:6d}] rss {rss:8.1f} MB (+{rss - baseline:6.1f})  keras models {stats.get('live_keras_models')}"
+                          f"  tf.function traces {stats.get('tf_function_traces')}  {(time.perf_counter() - start) / i * 1e3:.0f} ms/req")
+            growth = rss_bytes() / 2**20 - baseline
+
+            if profiler:
+                diff = profiler.diff(base_snap, profiler.take_snapshot("end"), top=10)
+                print(f"\ntracemalloc growth {diff['total_diff_kb'] / 1024:.1f} MB, top sites:")
+                for row in diff["top"]: print(f"  {row['size_diff_kb']:10.1f} KB  {row['count_diff']:+8d}  {row['where']}")
+    finally:
+        tmp.cleanup()
+        for f in RUNTIME_FILES:
+            if f not in existing and os.path.exists(os.path.join(ROOT, f)): os.remove(os.path.join(ROOT, f))
+
+    print(f"\n{args.iterations} requests, {failures} failed, RSS growth {growth:.1f} MB (limit {args.max_growth_mb} MB)")
+    if failures or growth > args.max_growth_mb:
+        print("SOAK FAILED")
+        return 1
+    print("SOAK PASSED")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
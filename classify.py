@@ -6,6 +6,8 @@ import traceback # Import traceback
 import uuid # <--- ADD THIS LINE TO FIX THE ERROR
 
 from gradcam import generate_gradcam
+from intake import read_image
+from tta import tta_predict
 
 # Load model once globally
 try:
@@ -54,8 +56,9 @@ def _validate_blood_smear(img_bgr):
     return True, ""
 
 
-def preprocess_image(image_path, target_size=(128, 128)):
-    img = cv2.imread(image_path)
+def preprocess_image(image_path, target_size=(128, 128), img=None):
+    # Pass an already-decoded BGR image to skip a second decode of the same file
+    if img is None: img = read_image(image_path)
     if img is None: raise ValueError(f"Image not found or unreadable at path: {image_path}")
     img = cv2.resize(img, target_size)
     img = img.astype('float32') / 255.0
@@ -64,7 +67,7 @@ def preprocess_image(image_path, target_size=(128, 128)):
         img = np.expand_dims(img, axis=-1)
     return np.expand_dims(img, axis=0)
 
-def predict_disease(image_path):
+def predict_disease(image_path, tta=False, tta_views=8):
     print(f"\n--- classify.py: Starting prediction for {os.path.basename(image_path)} ---") 
 
     # --- Model Loading Check ---
@@ -74,7 +77,7 @@ def predict_disease(image_path):
         
     # --- Validation ---
     try:
-        original = cv2.imread(image_path)
+        original = read_image(image_path)
         is_valid, reason = _validate_blood_smear(original)
         if not is_valid:
             print(f"--- classify.py: Image invalid: {reason} ---")
@@ -86,9 +89,15 @@ def predict_disease(image_path):
     # --- Prediction ---
     try:
         print("--- classify.py: Preprocessing image... ---")
-        img_input = preprocess_image(image_path)
-        print("--- classify.py: Running model prediction... ---")
-        prediction = model.predict(img_input)[0]
+        img_input = preprocess_image(image_path, img=original)
+        if tta:
+            # All views go through the classifier as a single batch
+            print(f"--- classify.py: Running {tta_views}-view TTA prediction... ---")
+            prediction, agreement = tta_predict(model, img_input, tta_views)
+        else:
+            print("--- classify.py: Running model prediction... ---")
+            prediction = model.predict(img_input)[0]
+            agreement = np.eye(len(prediction))[int(np.argmax(prediction))]  # a single view agrees with itself
         predicted_class = int(np.argmax(prediction))
         confidence = float(prediction[predicted_class]) * 100.0 
         class_name = label_map.get(predicted_class, "Unknown Class") 
@@ -121,7 +130,7 @@ def predict_disease(image_path):
 
         generate_gradcam(
             model, image_path, gradcam_path_abs, target_size=(128, 128), 
-            last_conv_layer_name=last_conv_layer_name 
+            last_conv_layer_name=last_conv_layer_name, pred_index=predicted_class
         )
         if os.path.exists(gradcam_path_abs):
              print(f"--- classify.py: Grad-CAM generated successfully: {gradcam_path_rel} ---")
@@ -141,5 +150,7 @@ def predict_disease(image_path):
         "explanation": explanation,
         "gradcam_url": gradcam_path_rel  # Return relative path 'static/outputs/gradcam/...'
     }
+    result["probabilities"] = {label_map.get(i, str(i)): round(float(p), 4) for i, p in enumerate(prediction)}
+    result["agreement"] = {label_map.get(i, str(i)): round(float(a), 3) for i, a in enumerate(agreement)}
     print(f"--- classify.py: Returning result: {result} ---") 
     return result
\ No newline at end of file
@@ -23,6 +23,8 @@ export const login = (userData) => api.post('/login', userData);
 export const getProfile = () => api.get('/profile');
 export const updateProfile = (data) => api.put('/profile', data);
 export const getReports = () => api.get('/reports');
+export const getAnalytics = (params) => api.get('/analytics', { params });
+export const getSiteAnalytics = (params) => api.get('/analytics/site', { params });
 
 // --- CRITICAL FIX: No manual 'Content-Type' header here ---
 // We allow axios to handle the multipart form data automatically.
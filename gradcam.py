@@ -3,9 +3,13 @@ import numpy as np
 import tensorflow as tf
 import os
 
-def generate_gradcam(model, img_path, output_path, target_size=(128, 128), last_conv_layer_name="conv2d_1"):
+from intake import read_image
+
+def generate_gradcam(model, img_path, output_path, target_size=(128, 128), last_conv_layer_name="conv2d_1", pred_index=None):
+    # pred_index: class to explain; defaults to this single view's argmax.
+    # Pass the reported class so a TTA diagnosis gets a matching heatmap.
     # Load image and preprocess
-    original_img = cv2.imread(img_path)
+    original_img = read_image(img_path, min_side=max(target_size))
     if original_img is None:
         raise ValueError("Failed to load image for Grad-CAM")
 
@@ -25,7 +29,8 @@ def generate_gradcam(model, img_path, output_path, target_size=(128, 128), last_
 
     with tf.GradientTape() as tape:
         conv_outputs, predictions = grad_model(img_array)
-        pred_index = tf.argmax(predictions[0])
+        if pred_index is None:
+            pred_index = tf.argmax(predictions[0])
         loss = predictions[:, pred_index]
 
     grads = tape.gradient(loss, conv_outputs)[0]
@@ -0,0 +1,294 @@
+# intake.py
+# Upload intake: reject bad uploads from the first bytes of the stream and
+# decode large JPEGs at reduced scale (the pipeline only needs 256x256 / 128x128).
+import os
+import struct
+
+import cv2
+from flask import Request
+
+MAX_IMAGE_PIXELS = int(os.environ.get("MAX_IMAGE_PIXELS", str(120_000_000)))
+MIN_IMAGE_SIDE = int(os.environ.get("MIN_IMAGE_SIDE", "32"))
+HEADER_CHUNK = 64 * 1024
+HEADER_SCAN_LIMIT = 512 * 1024  # JPEG EXIF/ICC blocks can push the SOF marker past 64 KB
+COPY_CHUNK = 256 * 1024
+
+# Largest input any stage needs (_validate_blood_smear works on 256x256)
+DECODE_MIN_SIDE = 256
+_REDUCED_FLAGS = [
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+]
+
+
+class UploadRejected(Exception):
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+
+# --- Header sniffing ---
+# Formats cv2.imread decodes in the stock opencv-python builds and that a
+# microscope or slide scanner is likely to produce.
+SUPPORTED_FORMATS = "JPEG, PNG, BMP, TIFF, WebP, JPEG 2000 or PNM"
+
+def sniff_format(head):
+    if head.startswith(b"\xff\xd8\xff"): return "jpeg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"): return "png"
+    if head.startswith(b"BM"): return "bmp"
+    if head[:4] in (b"II*\x00", b"MM\x00*"): return "tiff"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP": return "webp"
+    if head.startswith(b"\x00\x00\x00\x0cjP  \r\n\x87\n"): return "jp2"
+    if head.startswith(b"\xff\x4f\xff\x51"): return "j2k"
+    if head[:1] == b"P" and head[1:2] in (b"1", b"2", b"3", b"4", b"5", b"6") and head[2:3].isspace(): return "pnm"
+    return None
+
+def _png_size(head):
+    # Signature (8) + IHDR length (4) + "IHDR" (4) + width (4) + height (4)
+    if len(head) < 24 or head[12:16] != b"IHDR": return None
+    return struct.unpack(">II", head[16:24])
+
+def _bmp_size(head):
+    if len(head) < 26: return None
+    w, h = struct.unpack("<ii", head[18:26])
+    return abs(w), abs(h)
+
+def _jpeg_size(head):
+    i = 2
+    while i + 4 <= len(head):
+        if head[i] != 0xFF:
+            return None
+        marker = head[i + 1]
+        if marker == 0xFF:  # fill byte
+            i += 1
+            continue
+        if marker in (0x01, 0xD8) or 0xD0 <= marker <= 0xD7:  # markers without a length
+            i += 2
+            continue
+        seg_len = struct.unpack(">H", head[i + 2:i + 4])[0]
+        # SOF0..SOF15, excluding DHT (C4), JPG (C8) and DAC (CC)
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            if i + 9 > len(head): return None
+            h, w = struct.unpack(">HH", head[i + 5:i + 9])
+            return w, h
+        if marker == 0xDA:  # start of scan without a frame header
+            return None
+        i += 2 + seg_len
+    return None
+
+def _tiff_size(head):
+    endian = "<" if head[:2] == b"II" else ">"
+    if len(head) < 8: return None
+    ifd = struct.unpack(endian + "I", head[4:8])[0]
+    return _tiff_ifd_size(endian, head[ifd:])
+
+def _tiff_ifd_size(endian, ifd):
+    # ifd: bytes starting at the first IFD (entry count, then 12-byte entries)
+    if len(ifd) < 2: return None
+    count = struct.unpack(endian + "H", ifd[0:2])[0]
+    dims = {}
+    for n in range(count):
+        off = 2 + n * 12
+        if off + 12 > len(ifd): return None
+        tag, typ = struct.unpack(endian + "HH", ifd[off:off + 4])
+        if tag in (256, 257):
+            fmt = "H" if typ == 3 else "I"
+            dims[tag] = struct.unpack(endian + fmt, ifd[off + 8:off + 8 + struct.calcsize(fmt)])[0]
+    if 256 in dims and 257 in dims: return dims[256], dims[257]
+    return None
+
+def _tiff_size_from_file(path):
+    """Read the first IFD wherever it sits; writers often put it after the pixel data."""
+    with open(path, "rb") as f:
+        header = f.read(8)
+        if len(header) < 8: return None
+        endian = "<" if header[:2] == b"II" else ">"
+        f.seek(struct.unpack(endian + "I", header[4:8])[0])
+        ifd = f.read(2)
+        if len(ifd) < 2: return None
+        ifd += f.read(12 * struct.unpack(endian + "H", ifd)[0])
+    return _tiff_ifd_size(endian, ifd)
+
+def _webp_size(head):
+    chunk = head[12:16]
+    if chunk == b"VP8 " and len(head) >= 30:
+        w, h = struct.unpack("<HH", head[26:30])
+        return w & 0x3FFF, h & 0x3FFF
+    if chunk == b"VP8L" and len(head) >= 25:
+        b0, b1, b2, b3 = head[21:25]
+        return 1 + (b0 | (b1 & 0x3F) << 8), 1 + (b1 >> 6 | b2 << 2 | (b3 & 0x0F) << 10)
+    if chunk == b"VP8X" and len(head) >= 30:
+        return 1 + int.from_bytes(head[24:27], "little"), 1 + int.from_bytes(head[27:30], "little")
+    return None
+
+def _jp2_size(head):
+    # Image header box inside jp2h: height (4), width (4)
+    i = head.find(b"ihdr")
+    if i < 0 or i + 12 > len(head): return None
+    h, w = struct.unpack(">II", head[i + 4:i + 12])
+    return w, h
+
+def _j2k_size(head):
+    # SIZ segment: marker (2), Lsiz (2), Rsiz (2), Xsiz, Ysiz, XOsiz, YOsiz (4 each)
+    if len(head) < 24: return None
+    xsiz, ysiz, xo, yo = struct.unpack(">IIII", head[8:24])
+    return xsiz - xo, ysiz - yo
+
+def _pnm_size(head):
+    # "P6 <width> <height> ..." with optional '#' comment lines
+    tokens, i = [], 2
+    while len(tokens) < 2 and i < len(head):
+        c = head[i:i + 1]
+        if c == b"#":
+            end = head.find(b"\n", i)
+            if end < 0: return None
+            i = end + 1
+        elif c.isspace():
+            i += 1
+        else:
+            j = i
+            while j < len(head) and head[j:j + 1].isdigit(): j += 1
+            if j == i or j == len(head): return None
+            tokens.append(int(head[i:j]))
+            i = j
+    return tuple(tokens) if len(tokens) == 2 else None
+
+_SIZE_PARSERS = {"jpeg": _jpeg_size, "png": _png_size, "bmp": _bmp_size, "tiff": _tiff_size,
+                 "webp": _webp_size, "jp2": _jp2_size, "j2k": _j2k_size, "pnm": _pnm_size}
+
+def image_size(fmt, head):
+    """Return (width, height) parsed from the header bytes, or None if not found."""
+    try: return _SIZE_PARSERS[fmt](head)
+    except (struct.error, IndexError): return None
+
+def check_dimensions(size):
+    if size is None: return
+    w, h = size
+    if min(w, h) < MIN_IMAGE_SIDE:
+        raise UploadRejected(f"Image too small ({w}x{h}).", 400)
+    if w * h > MAX_IMAGE_PIXELS:
+        raise UploadRejected(f"Image too large ({w}x{h}).", 413)
+
+
+def inspect_header(head, complete=True):
+    """Validate signature and dimensions; (fmt, size), or None if more bytes are needed."""
+    if len(head) < 8 and not complete: return None
+    fmt = sniff_format(head)
+    if fmt is None:
+        raise UploadRejected(f"Unsupported file type. Upload a {SUPPORTED_FORMATS} image.", 415)
+    size = image_size(fmt, head)
+    if size is None and not complete:
+        limit = HEADER_SCAN_LIMIT if fmt == "jpeg" else HEADER_CHUNK
+        if len(head) < limit: return None
+    if size is None and fmt != "tiff":  # TIFF may keep its IFD at the end of the file
+        raise UploadRejected("Could not read image dimensions.", 400)
+    check_dimensions(size)
+    return fmt, size
+
+
+# --- Early rejection while the multipart body is parsed ---
+class _SniffingStream:
+    """Wraps werkzeug's upload container and checks the bytes as they arrive."""
+
+    def __init__(self, inner, max_bytes):
+        self._inner = inner
+        self._max_bytes = max_bytes
+        self._head = b""
+        self._written = 0
+        self.info = None
+
+    def write(self, data):
+        self._written += len(data)
+        if self._max_bytes and self._written > self._max_bytes:
+            raise UploadRejected("File too large.", 413)
+        if self.info is None:
+            self._head += data
+            self.info = inspect_header(self._head, complete=False)
+            if self.info is not None: self._head = b""
+        return self._inner.write(data)
+
+    def __iter__(self):
+        return iter(self._inner)
+
+    def __getattr__(self, name):
+        return getattr(self._inner, name)
+
+
+class IntakeRequest(Request):
+    """Request class whose file parts are validated while werkzeug parses them.
+
+    A non-image upload is refused after its first bytes and an oversized one
+    as soon as it crosses max_upload_bytes, instead of after the whole body
+    has been spooled to a temporary file.
+    """
+    max_upload_bytes = None
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        inner = super()._get_file_stream(total_content_length, content_type, filename, content_length)
+        return _SniffingStream(inner, self.max_upload_bytes)
+
+
+# --- Save ---
+def save_upload(file_storage, save_path, max_bytes):
+    """Re-check the (already parsed) upload's header and copy it to save_path.
+
+    With IntakeRequest the checks already ran during parsing; this keeps
+    save_upload safe for uploads that did not come through it, and removes
+    the partial file on any failure.
+    """
+    stream = file_storage.stream
+    head = stream.read(HEADER_CHUNK)
+    while True:
+        info = inspect_header(head, complete=False)
+        if info is not None: break
+        more = stream.read(HEADER_CHUNK)
+        if not more:
+            info = inspect_header(head)
+            break
+        head += more
+    fmt, size = info
+    if len(head) > max_bytes:
+        raise UploadRejected("File too large.", 413)
+
+    written = 0
+    try:
+        with open(save_path, "wb") as out:
+            chunk = head
+            while chunk:
+                written += len(chunk)
+                if written > max_bytes:
+                    raise UploadRejected("File too large.", 413)
+                out.write(chunk)
+                chunk = stream.read(COPY_CHUNK)
+        if fmt == "tiff" and size is None:
+            # The IFD was past the header window; the whole file is on disk now
+            size = _tiff_size_from_file(save_path)
+            if size is None: raise UploadRejected("Could not read image dimensions.", 400)
+            check_dimensions(size)
+    except Exception:
+        if os.path.exists(save_path): os.remove(save_path)
+        raise
+    return {"format": fmt, "width": size[0] if size else None,
+            "height": size[1] if size else None, "bytes": written}
+
+
+# --- Reduced-resolution decode ---
+def reduced_decode_flag(fmt, size, min_side=DECODE_MIN_SIDE):
+    """Pick the coarsest IMREAD_REDUCED_* scale that keeps both sides >= min_side."""
+    if fmt != "jpeg" or size is None: return cv2.IMREAD_COLOR
+    for factor, flag in _REDUCED_FLAGS:
+        if min(size) // factor >= min_side: return flag
+    return cv2.IMREAD_COLOR
+
+def read_image(image_path, min_side=DECODE_MIN_SIDE):
+    """cv2.imread replacement that decodes large JPEGs at 1/2, 1/4 or 1/8 scale."""
+    with open(image_path, "rb") as f:
+        head = f.read(HEADER_CHUNK)
+        fmt = sniff_format(head)
+        size = image_size(fmt, head) if fmt else None
+        if size is None and fmt == "jpeg":
+            head += f.read(HEADER_SCAN_LIMIT - len(head))
+            size = image_size(fmt, head)
+    return cv2.imread(image_path, reduced_decode_flag(fmt, size, min_side))
@@ -0,0 +1,169 @@
+# profiling.py
+# Opt-in per-worker memory profiler (ENABLE_PROFILING=1): tracemalloc
+# snapshots and diffs, RSS over time and TensorFlow / Keras object counts.
+import os
+import gc
+import sys
+import time
+import threading
+import tracemalloc
+from collections import OrderedDict, deque
+
+PROFILING_ENABLED = os.environ.get("ENABLE_PROFILING", "0") == "1"
+PROFILE_INTERVAL = float(os.environ.get("PROFILE_INTERVAL", "30"))
+PROFILE_FRAMES = int(os.environ.get("PROFILE_FRAMES", "10"))
+TF_STATS_TTL = float(os.environ.get("TF_STATS_TTL", "60"))
+MAX_SNAPSHOTS = 8
+MAX_SAMPLES = 2880  # a day of samples at the default interval
+
+
+def rss_bytes():
+    """Current resident set size of this process."""
+    try:
+        with open("/proc/self/statm") as f: resident = int(f.read().split()[1])
+        return resident * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        import resource  # peak, not current, but better than nothing off Linux
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+_tf_stats_cache = {"at": 0.0, "value": None}
+_tf_stats_lock = threading.Lock()
+
+def tf_stats(max_age=TF_STATS_TTL):
+    """tf_stats result cached for max_age seconds.
+
+    The heap walk holds the GIL over every live object, which stalls inference
+    in a loaded worker, so repeated admin calls reuse the last count.
+    """
+    with _tf_stats_lock:
+        now = time.time()
+        cached = _tf_stats_cache["value"]
+        if cached is None or max_age <= 0 or now - _tf_stats_cache["at"] > max_age:
+            cached = _count_tf_objects()
+            _tf_stats_cache.update(at=now, value=cached)
+        return dict(cached, age_s=round(now - _tf_stats_cache["at"], 1))
+
+
+def _count_tf_objects():
+    """Counts of live Keras models, tf.functions and their traces, and graph ops."""
+    if "tensorflow" not in sys.modules:
+        return {"tensorflow_loaded": False}
+    import tensorflow as tf
+    keras_models, functions, traces = 0, 0, 0
+    for obj in gc.get_objects():
+        try:
+            if isinstance(obj, tf.keras.Model): keras_models += 1
+            elif hasattr(obj, "experimental_get_tracing_count") and callable(obj):
+                functions += 1
+                traces += obj.experimental_get_tracing_count()
+        except Exception:
+            continue
+    return {
+        "tensorflow_loaded": True,
+        "live_keras_models": keras_models,
+        "tf_functions": functions,
+        "tf_function_traces": traces,
+        "default_graph_ops": len(tf.compat.v1.get_default_graph().get_operations()),
+    }
+
+
+def _format_stats(stats, top):
+    return [{"where": str(s.traceback[0]) if s.traceback else "?",
+             "size_kb": round(s.size / 1024, 1),
+             "size_diff_kb": round(getattr(s, "size_diff", 0) / 1024, 1),
+             "count": s.count, "count_diff": getattr(s, "count_diff", 0)}
+            for s in stats[:top]]
+
+
+class WorkerProfiler:
+    def __init__(self, interval=PROFILE_INTERVAL, frames=PROFILE_FRAMES):
+        self.interval = interval
+        self.frames = frames
+        self.started_at = None
+        self.samples = deque(maxlen=MAX_SAMPLES)
+        self._snapshots = OrderedDict()
+        self._next_id = 1
+        self._lock = threading.Lock()
+        self._thread = None
+
+    # --- lifecycle ---
+    def start(self):
+        if self.started_at is not None: return self
+        if not tracemalloc.is_tracing(): tracemalloc.start(self.frames)
+        self.started_at = time.time()
+        self.sample()
+        self.take_snapshot("start")
+        if self.interval > 0:
+            self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+            self._thread.start()
+        return self
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            self.sample()
+
+    # --- RSS over time ---
+    def sample(self):
+        current, peak = tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else (0, 0)
+        entry = {"t": round(time.time(), 1), "rss_mb": round(rss_bytes() / 2**20, 2),
+                 "traced_mb": round(current / 2**20, 2), "traced_peak_mb": round(peak / 2**20, 2)}
+        self.samples.append(entry)
+        return entry
+
+    # --- tracemalloc snapshots ---
+    def take_snapshot(self, label=""):
+        snap = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ))
+        with self._lock:
+            snap_id = self._next_id
+            self._next_id += 1
+            self._snapshots[snap_id] = {"label": label, "t": time.time(), "snapshot": snap}
+            # Keep the baseline ("start") plus the most recent ones
+            while len(self._snapshots) > MAX_SNAPSHOTS:
+                oldest = [k for k in self._snapshots if k != 1][0]
+                del self._snapshots[oldest]
+        return snap_id
+
+    def snapshots(self):
+        with self._lock:
+            return [{"id": k, "label": v["label"], "t": round(v["t"], 1)} for k, v in self._snapshots.items()]
+
+    def diff(self, base_id=None, target_id=None, top=25, key_type="lineno"):
+        """Top allocation growth between two snapshots (default: first vs latest)."""
+        with self._lock:
+            ids = list(self._snapshots)
+            base_id = base_id or ids[0]
+            target_id = target_id or ids[-1]
+            if base_id not in self._snapshots or target_id not in self._snapshots:
+                raise KeyError("Unknown snapshot id")
+            base = self._snapshots[base_id]["snapshot"]
+            target = self._snapshots[target_id]["snapshot"]
+        stats = target.compare_to(base, key_type)
+        return {"base": base_id, "target": target_id,
+                "total_diff_kb": round(sum(s.size_diff for s in stats) / 1024, 1),
+                "top": _format_stats(stats, top)}
+
+    def report(self, top=15):
+        current, peak = tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else (0, 0)
+        first = self.samples[0] if self.samples else None
+        latest = self.sample()
+        top_stats = tracemalloc.take_snapshot().statistics("lineno") if tracemalloc.is_tracing() else []
+        return {
+            "pid": os.getpid(),
+            "uptime_s": round(time.time() - self.started_at, 1) if self.started_at else 0,
+            "rss_mb": latest["rss_mb"],
+            "rss_growth_mb": round(latest["rss_mb"] - first["rss_mb"], 2) if first else 0.0,
+            "traced_mb": round(current / 2**20, 2),
+            "traced_peak_mb": round(peak / 2**20, 2),
+            "tensorflow": tf_stats(),
+            "top_allocations": _format_stats(top_stats, top),
+            "snapshots": self.snapshots(),
+        }
+
+
+profiler = WorkerProfiler()
@@ -5,6 +5,9 @@ import numpy as np
 import tensorflow as tf
 from tensorflow.keras.models import Model
 
+from intake import read_image
+from tta import tta_predict
+
 model = tf.keras.models.load_model("models/progression_model001.h5")
 
 label_map = {'benign': 0, 'early': 1, 'pre': 2, 'pro': 3}
@@ -13,11 +16,24 @@ class_names = {v: k for k, v in label_map.items()}
 def get_stage(class_name):
     return {'benign': 0, 'early': 1, 'pre': 2, 'pro': 3}.get(class_name, -1)
 
-def predict_stage(img_path, target_size=(128, 128), last_conv_layer_name="last_conv"):
-    img = cv2.imread(img_path)
+def predict_stage(img_path, target_size=(128, 128), last_conv_layer_name="last_conv", tta=False, tta_views=8):
+    img = read_image(img_path, min_side=max(target_size))
     img_resized = cv2.resize(img, target_size)
     img_input = np.expand_dims(img_resized / 255.0, axis=0)
 
+    if tta:
+        # One batched forward pass over the flipped/rotated views, no heatmap
+        probs, agreement = tta_predict(model, img_input, tta_views)
+        pred_index = int(np.argmax(probs))
+        pred_class = class_names[pred_index]
+        return {
+            "stage": get_stage(pred_class),
+            "stage_label": pred_class,
+            "confidence": round(float(probs[pred_index]) * 100, 2),
+            "probabilities": {class_names[i]: round(float(p), 4) for i, p in enumerate(probs)},
+            "agreement": {class_names[i]: round(float(a), 3) for i, a in enumerate(agreement)}
+        }
+
     grad_model = Model(
         inputs=model.input,
         outputs=[model.get_layer(last_conv_layer_name).output, model.output]
@@ -42,5 +58,7 @@ def predict_stage(img_path, target_size=(128, 128), last_conv_layer_name="last_c
     return {
         "stage": stage,
         "stage_label": pred_class,
-        "confidence": round(confidence * 100, 2)
+        "confidence": round(confidence * 100, 2),
+        "probabilities": {class_names[i]: round(float(p), 4) for i, p in enumerate(predictions[0].numpy())},
+        "agreement": {class_names[i]: float(i == pred_index.numpy()) for i in class_names}
     }
@@ -0,0 +1,33 @@
+# tta.py
+# Batched test-time augmentation: smear orientation is arbitrary, so score the
+# flips / 90-degree rotations of the preprocessed tensor in ONE forward call.
+import numpy as np
+
+MAX_VIEWS = 8
+
+
+def tta_views(img_input, n_views=MAX_VIEWS):
+    """Stack up to 8 dihedral views of a (1, H, W, C) tensor into one batch.
+
+    Order: the 4 rotations of the original, then the 4 rotations of its
+    horizontal mirror, so n_views=4 gives rotations only.
+    """
+    x = img_input[0]
+    views = []
+    for base in (x, x[:, ::-1]):
+        for k in range(4): views.append(np.rot90(base, k, axes=(0, 1)))
+    return np.ascontiguousarray(np.stack(views[:max(1, min(n_views, MAX_VIEWS))]))
+
+
+def tta_predict(net, img_input, n_views=MAX_VIEWS):
+    """Return (mean probabilities, per-class agreement) for one image.
+
+    Agreement for class c is the fraction of views whose top-1 is c.
+    Calling the model directly avoids model.predict's per-call setup,
+    which dominates at this batch size.
+    """
+    batch = tta_views(img_input, n_views).astype("float32")
+    probs = np.asarray(net(batch, training=False))
+    mean = probs.mean(axis=0)
+    agreement = np.bincount(probs.argmax(axis=1), minlength=probs.shape[1]) / float(len(probs))
+    return mean, agreement